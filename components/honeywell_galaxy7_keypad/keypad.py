@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
+import os
 import sys
 import time
+import functools
 import select
+import queue
+import threading
 import argparse
 try:
     import serial  # type: ignore
@@ -29,7 +33,8 @@ INIT_POLL_SECOND_MS       = 5000
 INIT_POLL_INTERVAL_MS     = 5000
 SCREEN_PUSH_INTERVAL_MS   = 25000
 ACTIVITY_POLL_INTERVAL_MS = 150
-REPLY_WAIT_S = 0.1  # 20 ms reply window – tweak if needed
+REPLY_WAIT_S = 0.1  # upper bound (matches galaxybus reply_timeout); complete replies are processed early
+BYTE_TIME_S  = 10 / 9600  # one 8N1 byte on the wire
 
 
 INIT_SECOND_POLL_DELAY    = INIT_POLL_SECOND_MS / 1000.0
@@ -46,23 +51,25 @@ CMD_ACTIVITY_19 = 3
 CMD_BEEP_0C     = 4
 
 
+# F4 key code (low nibble) -> key name
+_KEY_TABLE = ("0", "1", "2", "3", "4", "5", "6", "7", "8", "9", "B", "A", "ENT", "ESC", "*", "#")
+
+
 def bytes_to_hex(data: bytes | bytearray) -> str:
-    return " ".join(f"{b:02X}" for b in data)
+    return data.hex(" ").upper()
 
 
 def galaxy_checksum(data: bytes | bytearray) -> int:
     """Mirror the C++ checksum exactly."""
-    temp = 0xAA
-    for b in data:
-        temp += b
-    temp &= 0xFFFFFFFF
-    res = (
-        ((temp >> 24) & 0xFF)
-        + ((temp >> 16) & 0xFF)
-        + ((temp >> 8) & 0xFF)
-        + (temp & 0xFF)
-    ) & 0xFF
-    return res
+    temp = (0xAA + sum(data)) & 0xFFFFFFFF
+    # byte-wise fold; bits shifted into the low byte from above are masked off
+    return (temp + (temp >> 8) + (temp >> 16) + (temp >> 24)) & 0xFF
+
+
+@functools.lru_cache(maxsize=256)
+def _cs_three(a: int, b: int, c: int) -> int:
+    """Cached checksum for the common 3-byte poll payloads."""
+    return galaxy_checksum((a, b, c))
 
 
 def open_serial(port: str, baud: int = 9600) -> serial.Serial:
@@ -77,37 +84,73 @@ def open_serial(port: str, baud: int = 9600) -> serial.Serial:
     return ser
 
 
-def send_frame(ser: serial.Serial, payload: bytes | bytearray):
-    """Append checksum and send."""
-    cs = galaxy_checksum(payload)
-    frame = bytes(payload) + bytes([cs])
+# ---- Pre-built fixed frames (filled by build_frames once panel_id is known) ----
+FRAME_INIT_POLL     = "poll_00_0E"
+FRAME_STATUS_POLL   = "poll_00_0F"
+FRAME_ACTIVITY_POLL = "activity_19_01"
+FRAME_BEEP_OFF      = "beep_0C_off"
+
+FRAMES: dict[str, bytes] = {}
+
+
+def _frame(*payload: int) -> bytes:
+    """Payload bytes with checksum appended."""
+    return bytes(payload) + bytes([galaxy_checksum(payload)])
+
+
+def build_frames(panel_id: int):
+    """Precompute the fixed poll/beep frames; panel_id never changes at runtime."""
+    FRAMES[FRAME_INIT_POLL] = _frame(panel_id, 0x00, 0x0E)
+    FRAMES[FRAME_STATUS_POLL] = _frame(panel_id, 0x00, 0x0F)
+    FRAMES[FRAME_ACTIVITY_POLL] = _frame(panel_id, 0x19, 0x01)
+    FRAMES[FRAME_BEEP_OFF] = _frame(panel_id, 0x0C, 0x00, 0x00, 0x00)
+
+
+def write_frame(ser: serial.Serial, frame: bytes | bytearray) -> float:
+    """
+    Send an already checksummed frame without flushing.
+
+    Returns the estimated monotonic time the last byte leaves the wire, so the
+    reply window can start from the end of TX rather than from the write call.
+    """
     if LOG_FRAMES:
         print(f"[TX] {bytes_to_hex(frame)}")
         sys.stdout.flush()
     ser.write(frame)
-    ser.flush()
+    return time.monotonic() + len(frame) * BYTE_TIME_S
 
 
-def send_init_poll_00_0E(ser: serial.Serial, panel_id: int):
-    send_frame(ser, bytes([panel_id, 0x00, 0x0E]))
+def send_frame(ser: serial.Serial, payload: bytes | bytearray | tuple[int, ...]) -> float:
+    """Append checksum and send."""
+    if len(payload) == 3:
+        cs = _cs_three(payload[0], payload[1], payload[2])
+    else:
+        cs = galaxy_checksum(payload)
+    return write_frame(ser, bytes(payload) + bytes([cs]))
 
 
-def send_status_poll_00_0F(ser: serial.Serial, panel_id: int):
-    send_frame(ser, bytes([panel_id, 0x00, 0x0F]))
+def send_init_poll_00_0E(ser: serial.Serial) -> float:
+    return write_frame(ser, FRAMES[FRAME_INIT_POLL])
 
 
-def send_activity_poll_19_01(ser: serial.Serial, panel_id: int):
-    send_frame(ser, bytes([panel_id, 0x19, 0x01]))
+def send_status_poll_00_0F(ser: serial.Serial) -> float:
+    return write_frame(ser, FRAMES[FRAME_STATUS_POLL])
 
 
-def send_beep_mode_0C(ser: serial.Serial, panel_id: int, mode: int, beep_period: int = 0x00, quiet_period: int = 0x00):
+def send_activity_poll_19_01(ser: serial.Serial) -> float:
+    return write_frame(ser, FRAMES[FRAME_ACTIVITY_POLL])
+
+
+def send_beep_mode_0C(ser: serial.Serial, panel_id: int, mode: int, beep_period: int = 0x00, quiet_period: int = 0x00) -> float:
     """
     Command 0C sets keypad beep mode.
 
     mode: 0=off, 1=on, 3=intermittent (period/quiet in 1/10s)
     """
+    if mode == 0x00 and beep_period == 0x00 and quiet_period == 0x00:
+        return write_frame(ser, FRAMES[FRAME_BEEP_OFF])
     payload = bytes([panel_id, 0x0C, mode & 0xFF, beep_period & 0xFF, quiet_period & 0xFF])
-    send_frame(ser, payload)
+    return send_frame(ser, payload)
 
 
 def build_screen_frame(panel_id: int, display_text: str) -> bytes:
@@ -141,6 +184,34 @@ def build_screen_frame(panel_id: int, display_text: str) -> bytes:
     return bytes(screen)
 
 
+@functools.lru_cache(maxsize=8)
+def _screen_with_cs(panel_id: int, display_text: str) -> bytes:
+    """Screen frame with checksum appended, ready to write."""
+    screen = build_screen_frame(panel_id, display_text)
+    return screen + bytes([galaxy_checksum(screen)])
+
+
+def _reply_complete(buf: bytes | bytearray, keypad_addr: int) -> bool:
+    """
+    True once buf holds a whole keypad reply, based on the known shapes:
+
+      11 FE BA             ok / busy
+      11 F2 xx             bad frame
+      11 F4 code cs        key / tamper
+      11 FF 08 00 64 28    00 poll status
+    """
+    if len(buf) < 2 or buf[0] != keypad_addr:
+        return False
+    type_ = buf[1]
+    if type_ == 0xF4:
+        return len(buf) >= 4
+    if type_ in (0xFE, 0xF2):
+        return len(buf) >= 3
+    if type_ == 0xFF:
+        return len(buf) >= 6
+    return False
+
+
 def handle_stdin_line(line: str, state: dict):
     line = line.strip()
     if not line:
@@ -167,6 +238,16 @@ def handle_stdin_line(line: str, state: dict):
     state["screen_dirty"] = True
     print(f"[CMD] Set display text: {line!r}")
 
+
+def _stdin_reader(q: queue.SimpleQueue):
+    """Blocking stdin reader for a daemon thread; puts None on EOF."""
+    try:
+        for line in sys.stdin:
+            q.put(line)
+    finally:
+        q.put(None)
+
+
 def decode_key_and_tamper(code: int):
     """
     Decode the 3rd byte of an F4 reply:
@@ -185,150 +266,180 @@ def decode_key_and_tamper(code: int):
     if code == 0x7F:
         return None, True
 
-    tamper = bool(code & 0x40)
-    key_code = code & 0x0F
-
-    key_map = {
-        0x00: "0",
-        0x01: "1",
-        0x02: "2",
-        0x03: "3",
-        0x04: "4",
-        0x05: "5",
-        0x06: "6",
-        0x07: "7",
-        0x08: "8",
-        0x09: "9",
-        0x0A: "B",
-        0x0B: "A",
-        0x0C: "ENT",
-        0x0D: "ESC",
-        0x0E: "*",
-        0x0F: "#",
-    }
-
-    return key_map.get(key_code), tamper
-
-def handle_reply_for_cmd(bytes_in: bytes,
-                         panel_id: int,
-                         keypad_addr: int,
-                         state: dict):
-    if LOG_FRAMES:
-        print(f"[RX for last_cmd={state['last_cmd']}] {bytes_to_hex(bytes_in)}")
-
-    if not bytes_in or bytes_in[0] != keypad_addr or len(bytes_in) < 2:
-        return
+    return _KEY_TABLE[code & 0x0F], bool(code & 0x40)
 
-    type_ = bytes_in[1]
-    last_cmd = state["last_cmd"]
+def update_tamper(state: dict, new_tamper: bool, context: str, frame: bytes | None = None) -> bool:
+    """Set tamper state and log only when it changes."""
+    prev = state["in_tamper"]
+    if new_tamper == prev:
+        return False
+    state["in_tamper"] = new_tamper
+    msg = f"[TAMPER] {context}: {new_tamper}"
+    if frame:
+        msg += f" {bytes_to_hex(frame)}"
+    print(msg)
+    return True
 
-    def update_tamper(new_tamper: bool, context: str, frame: bytes | None = None) -> bool:
-        """Set tamper state and log only when it changes."""
-        prev = state["in_tamper"]
-        if new_tamper == prev:
-            return False
-        state["in_tamper"] = new_tamper
-        msg = f"[TAMPER] {context}: {new_tamper}"
-        if frame:
-            msg += f" {bytes_to_hex(frame)}"
-        print(msg)
-        return True
 
-    # --- Simple cases first: FE / FF etc for non-F4 replies ---
+# --- Simple cases: FE / FF / F2 for non-F4 replies ---
 
+def _h_poll_ack(bytes_in: bytes, panel_id: int, keypad_addr: int, state: dict):
     # status / 00 polls
-    if last_cmd == CMD_POLL_00:
-        state["needs_status_before_screen"] = False
-        # things like 11 FF 08 00 64 28, 11 FE BA, etc – C++ ignores them
-        return
+    # things like 11 FF 08 00 64 28, 11 FE BA, etc – C++ ignores them
+    state["needs_status_before_screen"] = False
+
 
+def _h_noop(bytes_in: bytes, panel_id: int, keypad_addr: int, state: dict):
     # activity poll: 11 FE BA => no key/tamper change
-    if last_cmd == CMD_ACTIVITY_19 and type_ == 0xFE:
-        return
+    pass
 
+
+def _h_screen_rej(bytes_in: bytes, panel_id: int, keypad_addr: int, state: dict):
     # screen write: F2 => "bad frame"
-    if last_cmd == CMD_SCREEN_07 and type_ == 0xF2:
-        print(f"[SCREEN] Keypad rejected frame (F2): {bytes_to_hex(bytes_in)}")
-        return
+    print(f"[SCREEN] Keypad rejected frame (F2): {bytes_to_hex(bytes_in)}")
+
 
+def _h_screen_ok(bytes_in: bytes, panel_id: int, keypad_addr: int, state: dict):
     # screen write: FE BA => "busy/OK"
-    if last_cmd == CMD_SCREEN_07 and type_ == 0xFE and len(bytes_in) >= 3 and bytes_in[2] == 0xBA:
-        update_tamper(False, "Cleared after SCREEN FE BA", bytes_in)
-        if LOG_FRAMES:
-            print(f"[SCREEN] Keypad OK (busy) FE BA: {bytes_to_hex(bytes_in)}")
+    if len(bytes_in) < 3 or bytes_in[2] != 0xBA:
         return
+    update_tamper(state, False, "Cleared after SCREEN FE BA", bytes_in)
+    if LOG_FRAMES:
+        print(f"[SCREEN] Keypad OK (busy) FE BA: {bytes_to_hex(bytes_in)}")
+
 
+def _h_beep_ok(bytes_in: bytes, panel_id: int, keypad_addr: int, state: dict):
     # beep mode: treat FE BA as OK/busy (same shape as screen ack)
-    if last_cmd == CMD_BEEP_0C and type_ == 0xFE and len(bytes_in) >= 3 and bytes_in[2] == 0xBA:
-        if LOG_FRAMES:
-            print(f"[BEEP] Keypad OK (FE BA): {bytes_to_hex(bytes_in)}")
+    if len(bytes_in) < 3 or bytes_in[2] != 0xBA:
         return
+    if LOG_FRAMES:
+        print(f"[BEEP] Keypad OK (FE BA): {bytes_to_hex(bytes_in)}")
 
-    # --- Now handle F4 once, for all last_cmd values ---
-
-    if type_ == 0xF4 and len(bytes_in) == 4:
-        code = bytes_in[2]
-        cs   = bytes_in[3]
-        expected = galaxy_checksum(bytes([keypad_addr, 0xF4, code]))
-        if expected != cs:
-            print(f"[F4] Bad checksum: {bytes_to_hex(bytes_in)}")
-            return
 
-        key_name, tamper = decode_key_and_tamper(code)
-        tamper_changed = update_tamper(tamper, "From F4", bytes_in)
+def _h_f4(bytes_in: bytes, panel_id: int, keypad_addr: int, state: dict):
+    """F4 key/tamper reply, handled once for all last_cmd values."""
+    if len(bytes_in) != 4:
+        return
 
-        # safety: if it's neither key nor tamper, bail
-        if key_name is None and not tamper:
-            print(f"[F4] Unknown code=0x{code:02X}: {bytes_to_hex(bytes_in)}")
-            return
+    last_cmd = state["last_cmd"]
+    code = bytes_in[2]
+    cs   = bytes_in[3]
+    base = state.get("f4_cs_base")
+    if base is not None:
+        t = (base + code) & 0xFFFFFFFF
+        expected = (t + (t >> 8) + (t >> 16) + (t >> 24)) & 0xFF
+    else:
+        expected = galaxy_checksum(bytes([keypad_addr, 0xF4, code]))
+    if expected != cs:
+        print(f"[F4] Bad checksum: {bytes_to_hex(bytes_in)}")
+        return
 
-        # --- SCREEN context: screen ACK + optional tamper, no 0B here ---
-        if last_cmd == CMD_SCREEN_07:
-            if code == 0x7F:
-                print(f"[SCREEN] ACK (tamper={tamper}) {bytes_to_hex(bytes_in)}")
-            else:
-                # you *can* see key+tamper piggybacked here; debug only
-                if LOG_FRAMES:
-                    tstr = " [TAMPER]" if tamper else ""
-                    print(f"[SCREEN reply] key={key_name}{tstr} {bytes_to_hex(bytes_in)}")
-            return
+    key_name, tamper = decode_key_and_tamper(code)
+    tamper_changed = update_tamper(state, tamper, "From F4", bytes_in)
 
-        # --- ACTIVITY poll (19 01): real key events live here ---
-        if last_cmd == CMD_ACTIVITY_19:
-            # tamper-only (0x7F) – no key; just track tamper and bail
-            if key_name is None:
-                if LOG_FRAMES or tamper_changed:
-                    print(f"[KEY] tamper-only [TAMPER] {bytes_to_hex(bytes_in)}")
-                return
-
-            # there *is* a key: de-dup logs but ALWAYS send a 0B ACK & flip the toggle
-            now = time.monotonic()
-            last_evt = state.get("last_key_event", {"key": None, "tamper": None, "ts": 0.0})
-            if not (
-                last_evt["key"] == key_name
-                and last_evt["tamper"] == tamper
-                and (now - last_evt["ts"]) <= 0.2
-            ):
+    # --- SCREEN context: screen ACK + optional tamper, no 0B here ---
+    if last_cmd == CMD_SCREEN_07:
+        if code == 0x7F:
+            print(f"[SCREEN] ACK (tamper={tamper}) {bytes_to_hex(bytes_in)}")
+        else:
+            # you *can* see key+tamper piggybacked here; debug only
+            if LOG_FRAMES:
                 tstr = " [TAMPER]" if tamper else ""
-                print(f"[KEY] key={key_name}{tstr} {bytes_to_hex(bytes_in)}")
-                state["last_key_event"] = {"key": key_name, "tamper": tamper, "ts": now}
+                print(f"[SCREEN reply] key={key_name}{tstr} {bytes_to_hex(bytes_in)}")
+        return
 
-            # ACK back to keypad {panel_id, 0x0B, ack_toggle} and FLIP it every time
-            ack_val = state["ack_toggle"]
-            send_frame(state["ser"], bytes([panel_id, 0x0B, ack_val]))
-            state["ack_toggle"] = 0x02 if ack_val == 0x00 else 0x00
+    # --- ACTIVITY poll (19 01): real key events live here ---
+    if last_cmd == CMD_ACTIVITY_19:
+        # tamper-only (0x7F) – no key; just track tamper and bail
+        if key_name is None:
+            if LOG_FRAMES or tamper_changed:
+                print(f"[KEY] tamper-only [TAMPER] {bytes_to_hex(bytes_in)}")
             return
 
-        # --- F4 after other commands (00 poll, beep, etc.) ---
-        # Only interesting for tamper tracking; no 0B here.
-        if LOG_FRAMES:
+        # there *is* a key: de-dup logs but ALWAYS send a 0B ACK & flip the toggle
+        now = time.monotonic()
+        last_evt = state.get("last_key_event", {"key": None, "tamper": None, "ts": 0.0})
+        if not (
+            last_evt["key"] == key_name
+            and last_evt["tamper"] == tamper
+            and (now - last_evt["ts"]) <= 0.2
+        ):
             tstr = " [TAMPER]" if tamper else ""
-            if key_name:
-                print(f"[F4 OTHER after cmd={last_cmd}] key={key_name}{tstr} {bytes_to_hex(bytes_in)}")
-            else:
-                print(f"[F4 OTHER after cmd={last_cmd}] tamper-only{tstr} {bytes_to_hex(bytes_in)}")
+            print(f"[KEY] key={key_name}{tstr} {bytes_to_hex(bytes_in)}")
+            state["last_key_event"] = {"key": key_name, "tamper": tamper, "ts": now}
+
+        # ACK back to keypad {panel_id, 0x0B, ack_toggle} and FLIP it every time
+        ack_val = state["ack_toggle"]
+        # not awaited, so record when it clears the bus before the next TX
+        state["tx_busy_until"] = send_frame(state["ser"], (panel_id, 0x0B, ack_val))
+        state["ack_toggle"] = 0x02 if ack_val == 0x00 else 0x00
         return
 
+    # --- F4 after other commands (beep, etc.) ---
+    # Only interesting for tamper tracking; no 0B here.
+    if LOG_FRAMES:
+        tstr = " [TAMPER]" if tamper else ""
+        if key_name:
+            print(f"[F4 OTHER after cmd={last_cmd}] key={key_name}{tstr} {bytes_to_hex(bytes_in)}")
+        else:
+            print(f"[F4 OTHER after cmd={last_cmd}] tamper-only{tstr} {bytes_to_hex(bytes_in)}")
+
+
+# (last_cmd, reply type) -> handler; a type of None matches any reply to that command
+_HANDLERS = {
+    (CMD_POLL_00, None): _h_poll_ack,
+    (CMD_ACTIVITY_19, 0xFE): _h_noop,
+    (CMD_SCREEN_07, 0xF2): _h_screen_rej,
+    (CMD_SCREEN_07, 0xFE): _h_screen_ok,
+    (CMD_BEEP_0C, 0xFE): _h_beep_ok,
+}
+
+
+def handle_reply_for_cmd(bytes_in: bytes,
+                         panel_id: int,
+                         keypad_addr: int,
+                         state: dict):
+    if LOG_FRAMES:
+        print(f"[RX for last_cmd={state['last_cmd']}] {bytes_to_hex(bytes_in)}")
+
+    if not bytes_in or bytes_in[0] != keypad_addr or len(bytes_in) < 2:
+        return
+
+    type_ = bytes_in[1]
+    last_cmd = state["last_cmd"]
+
+    h = _HANDLERS.get((last_cmd, type_)) or _HANDLERS.get((last_cmd, None))
+    if h is None and type_ == 0xF4:
+        h = _h_f4
+    if h is not None:
+        h(bytes_in, panel_id, keypad_addr, state)
+
+
+def next_cmd_due(state: dict, now: float) -> int:
+    """Pick the single command due at `now` (CMD_NONE if nothing is)."""
+    # a) second init poll (00 0F) once after 200 ms
+    if (not state["sent_second_init"]
+        and now - state["last_init_poll"] >= INIT_SECOND_POLL_DELAY):
+        return CMD_POLL_00
+
+    # b) periodic 00 0F every 1s
+    if now - state["last_init_poll"] >= STATUS_POLL_INTERVAL or state["needs_status_before_screen"]:
+        return CMD_POLL_00
+
+    # c) one-time beep disable once init is done
+    if state["sent_second_init"] and not state["beep_set"]:
+        return CMD_BEEP_0C
+
+    # d) screen update ASAP if text has changed
+    if state["sent_second_init"] and state["screen_dirty"] and not state["needs_status_before_screen"]:
+        return CMD_SCREEN_07
+
+    # e) activity poll (19 01) every 150ms
+    if now - state["last_activity_poll"] >= ACTIVITY_POLL_INTERVAL:
+        return CMD_ACTIVITY_19
+
+    return CMD_NONE
+
 
 def main():
     parser = argparse.ArgumentParser()
@@ -340,6 +451,7 @@ def main():
     keypad_addr = 0x11
 
     ser = open_serial(args.port)
+    build_frames(panel_id)
 
     print(f"Opened {args.port}, panel ID 0x{panel_id:02X}, keypad 0x{keypad_addr:02X}")
 
@@ -355,71 +467,52 @@ def main():
         "ack_toggle": 0x00,
         "awaiting_reply": False,
         "last_tx_time": 0.0,
+        "tx_busy_until": 0.0,
         "rx_buf": bytearray(),
         "quit": False,
         "in_tamper": False,
         "screen_dirty": False,
         "last_key_event": {"key": None, "tamper": None, "ts": 0.0},
         "beep_set": False,
-        "needs_status_before_screen": False
+        "needs_status_before_screen": False,
+        # checksum seed for F4 replies: 0xAA + keypad_addr + 0xF4
+        "f4_cs_base": 0xAA + keypad_addr + 0xF4,
     }
 
+    stdin_q: queue.SimpleQueue = queue.SimpleQueue()
+    threading.Thread(target=_stdin_reader, args=(stdin_q,), daemon=True).start()
+
     # initial 00 0E like C++
-    send_init_poll_00_0E(ser, panel_id)
+    state["last_tx_time"] = send_init_poll_00_0E(ser)
     state["last_cmd"] = CMD_POLL_00
     state["awaiting_reply"] = True
-    state["last_tx_time"] = time.monotonic()
     state["rx_buf"].clear()
 
     while not state["quit"]:
         now = time.monotonic()
 
-        # --- 1. If idle: pick exactly ONE thing to send ---
-        if not state["awaiting_reply"]:
-            cmd_to_send = CMD_NONE
-
-
-            # a) second init poll (00 0F) once after 200 ms
-            if (not state["sent_second_init"]
-                and now - state["last_init_poll"] >= INIT_SECOND_POLL_DELAY):
-                cmd_to_send = CMD_POLL_00
-
-            # b) periodic 00 0F every 1s
-            elif now - state["last_init_poll"] >= STATUS_POLL_INTERVAL or state["needs_status_before_screen"]:
-                cmd_to_send = CMD_POLL_00
-
-            # c) one-time beep disable once init is done
-            elif state["sent_second_init"] and not state["beep_set"]:
-                cmd_to_send = CMD_BEEP_0C
-            
-            # d) screen update ASAP if text has changed
-            elif state["sent_second_init"] and state["screen_dirty"] and not state["needs_status_before_screen"]:
-                cmd_to_send = CMD_SCREEN_07
-
-
-            # e) activity poll (19 01) every 50ms
-            elif now - state["last_activity_poll"] >= ACTIVITY_POLL_INTERVAL:
-                cmd_to_send = CMD_ACTIVITY_19
+        # --- 1. If idle (and any unawaited ACK is off the bus): pick exactly ONE thing to send ---
+        if not state["awaiting_reply"] and now >= state["tx_busy_until"]:
+            cmd_to_send = next_cmd_due(state, now)
 
             # If something is due, send just that one
             if cmd_to_send != CMD_NONE:
                 if cmd_to_send == CMD_POLL_00:
                     if not state["sent_second_init"]:
                         # second init poll
-                        send_status_poll_00_0F(ser, panel_id)
+                        tx_done = send_status_poll_00_0F(ser)
                         state["sent_second_init"] = True
                     else:
                         # regular status poll
-                        send_status_poll_00_0F(ser, panel_id)
+                        tx_done = send_status_poll_00_0F(ser)
                     state["last_init_poll"] = now
 
                 elif cmd_to_send == CMD_SCREEN_07:
                     print("screen dirty:", state["screen_dirty"])
-                    screen_payload = build_screen_frame(panel_id, state["display_text"])
-                    frame_with_cs = screen_payload + bytes([galaxy_checksum(screen_payload)])
+                    frame_with_cs = _screen_with_cs(panel_id, state["display_text"])
                     if LOG_FRAMES:
                         print(f"[SCREEN TX] ({len(frame_with_cs)} bytes): {bytes_to_hex(frame_with_cs)}")
-                    send_frame(ser, screen_payload)
+                    tx_done = write_frame(ser, frame_with_cs)
                     state["last_screen_push"] = now
                     state["screen_dirty"] = False
                     state["needs_status_before_screen"] = True
@@ -427,34 +520,33 @@ def main():
 
                 elif cmd_to_send == CMD_BEEP_0C:
                     # ensure keypad is silent after start: mode=0 (off), zero periods
-                    send_beep_mode_0C(ser, panel_id, mode=0x00, beep_period=0x00, quiet_period=0x00)
+                    tx_done = send_beep_mode_0C(ser, panel_id, mode=0x00, beep_period=0x00, quiet_period=0x00)
                     state["beep_set"] = True
 
                 elif cmd_to_send == CMD_ACTIVITY_19:
-                    send_activity_poll_19_01(ser, panel_id)
+                    tx_done = send_activity_poll_19_01(ser)
                     state["last_activity_poll"] = now
 
-                # mark that we've sent something and now expect a reply
+                # mark that we've sent something and now expect a reply;
+                # the reply window starts once the frame is off the wire
                 state["last_cmd"] = cmd_to_send
                 state["awaiting_reply"] = True
-                state["last_tx_time"] = now
+                state["last_tx_time"] = tx_done
                 state["rx_buf"].clear()
 
         # --- 2. Always read serial into rx_buf ---
-        while True:
-            try:
-                b = ser.read(1)
-            except serial.SerialException as e:
-                print(f"[SERIAL] Error: {e}", file=sys.stderr)
-                state["quit"] = True
-                break
-            if not b:
-                break
-            state["rx_buf"].extend(b)
-
-        # --- 3. If waiting for a reply and time’s up: process it ---
+        try:
+            n = ser.in_waiting
+            if n:
+                state["rx_buf"].extend(ser.read(n))
+        except (serial.SerialException, OSError) as e:
+            print(f"[SERIAL] Error: {e}", file=sys.stderr)
+            state["quit"] = True
+
+        # --- 3. If waiting for a reply and it's complete (or time's up): process it ---
         if state["awaiting_reply"]:
-            if (now - state["last_tx_time"]) >= REPLY_WAIT_S:
+            if (_reply_complete(state["rx_buf"], keypad_addr)
+                    or (now - state["last_tx_time"]) >= REPLY_WAIT_S):
                 if state["rx_buf"]:
                     # treat whatever we got in this window as the reply
                     handle_reply_for_cmd(bytes(state["rx_buf"]), panel_id, keypad_addr, state)
@@ -465,18 +557,46 @@ def main():
                 state["rx_buf"].clear()
                 state["awaiting_reply"] = False
 
-        # --- 4. Stdin non-blocking ---
-        rlist, _, _ = select.select([sys.stdin], [], [], 0.0)
-        if sys.stdin in rlist:
-            line = sys.stdin.readline()
-            if line == "":
+        # --- 4. Stdin lines queued by the reader thread ---
+        try:
+            line = stdin_q.get_nowait()
+        except queue.Empty:
+            pass
+        else:
+            if line is None:
                 state["quit"] = True
             else:
                 handle_stdin_line(line, state)
 
-        time.sleep(0.002)
+        # --- 5. Sleep until serial RX or the next deadline ---
+        if os.name == "nt":
+            # select() can't wait on serial handles on Windows
+            time.sleep(0.002)
+            continue
+
+        wake = time.monotonic()
+        if state["awaiting_reply"]:
+            next_deadline = state["last_tx_time"] + REPLY_WAIT_S
+        elif next_cmd_due(state, wake) != CMD_NONE:
+            next_deadline = max(wake, state["tx_busy_until"])
+        else:
+            # only the timed polls (a, b, e) can become due later
+            next_deadline = max(min(
+                state["last_activity_poll"] + ACTIVITY_POLL_INTERVAL,
+                state["last_init_poll"] + (STATUS_POLL_INTERVAL if state["sent_second_init"]
+                                           else INIT_SECOND_POLL_DELAY),
+            ), state["tx_busy_until"])
+        # stdin arrives via the reader thread, so cap the wait to keep CLI responsive
+        timeout = min(max(0.0, next_deadline - wake), ACTIVITY_POLL_INTERVAL)
+        if timeout > 0:
+            select.select([ser], [], [], timeout)
 
     print("[MAIN] Exiting...")
+    try:
+        ser.flush()
+    except (serial.SerialException, OSError):
+        # port already gone (e.g. adapter unplugged) – nothing left to drain
+        pass
     ser.close()
 
 